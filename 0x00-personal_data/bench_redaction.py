@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark for filter_datum and RedactingFormatter
+
+Usage:
+    ./bench_redaction.py [--lines N] [--repeat 5] [--save-baseline FILE]
+                         [--compare FILE] [--tolerance 0.1]
+
+Each case is run once to warm up, then timed --repeat times; the
+best run is reported and compared against the baseline.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import random
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+MESSAGE_LENGTHS = (64, 512, 4096)
+FIELD_COUNTS = (1, 3, len(PII_FIELDS))
+PII_SHARES = (0.0, 0.5, 1.0)
+SEPARATORS = (";", ",")
+REDACTION = "***"
+ALLOC_SAMPLES = 200
+REPEAT = 5
+
+
+def make_messages(count: int, length: int, fields: tuple, share: float,
+                  separator: str, seed: int = 0) -> List[str]:
+    """
+    Build count messages of about length characters, a share of
+    which carry values for the given PII fields.
+    """
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        parts = []
+        if rng.random() < share:
+            parts = ["{}=value{}".format(field, i) for field in fields]
+        parts.append("request_id={}".format(i))
+        message = separator.join(parts) + separator
+        padding = length - len(message) - len("info=")
+        if padding > 0:
+            message += "info=" + "x" * padding + separator
+        messages.append(message)
+    return messages
+
+
+def time_lines(func: Callable[[str], str], messages: List[str],
+               repeat: int = REPEAT) -> float:
+    """
+    Returns the number of messages processed per second in the
+    fastest of repeat passes, after one warm-up pass.
+    """
+    def one_pass():
+        for message in messages:
+            func(message)
+
+    one_pass()
+    elapsed = min(timeit.repeat(one_pass, repeat=max(1, repeat), number=1))
+    return len(messages) / elapsed if elapsed > 0 else float("inf")
+
+
+def alloc_per_line(func: Callable[[str], str], messages: List[str]) -> float:
+    """
+    Returns the average peak of bytes allocated while processing
+    one message, measured with tracemalloc on a sample.
+    """
+    sample = messages[:ALLOC_SAMPLES]
+    total = 0
+    tracemalloc.start()
+    try:
+        for message in sample:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            func(message)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(sample) if sample else 0.0
+
+
+def run(lines: int, repeat: int = REPEAT) -> Dict[str, dict]:
+    """
+    Run every case and return its results keyed by case name.
+    """
+    results = {}
+    grid = itertools.product(MESSAGE_LENGTHS, FIELD_COUNTS,
+                             PII_SHARES, SEPARATORS)
+    for length, n_fields, share, separator in grid:
+        fields = PII_FIELDS[:n_fields]
+        messages = make_messages(lines, length, fields, share, separator)
+        formatter_class = type("BenchFormatter", (RedactingFormatter,),
+                               {"SEPARATOR": separator})
+        formatter = formatter_class(fields=fields)
+
+        def datum(message):
+            return filter_datum(fields, REDACTION, message, separator)
+
+        def fmt(message):
+            record = logging.LogRecord("user_data", logging.INFO, None,
+                                       None, message, None, None)
+            return formatter.format(record)
+
+        for name, func in (("filter_datum", datum), ("format", fmt)):
+            case = "{} len={} fields={} pii={} sep={}".format(
+                name, length, n_fields, share, separator)
+            results[case] = {
+                "lines_per_second": time_lines(func, messages, repeat),
+                "bytes_per_line": alloc_per_line(func, messages),
+            }
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict],
+            tolerance: float) -> List[str]:
+    """
+    Returns the cases whose best run got slower than the
+    baseline by more than tolerance.
+    """
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        ratio = result["lines_per_second"] / base["lines_per_second"]
+        if ratio < 1 - tolerance:
+            regressions.append(
+                "{}: {:.0f} -> {:.0f} lines/s ({:+.1%})".format(
+                    case, base["lines_per_second"],
+                    result["lines_per_second"], ratio - 1))
+    return regressions
+
+
+def main() -> int:
+    """
+    Run the benchmark, print the results and handle baselines.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = run(args.lines, args.repeat)
+    for case, result in results.items():
+        print("{:<50} {:>12.0f} lines/s {:>10.0f} B/line".format(
+            case, result["lines_per_second"], result["bytes_per_line"]))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
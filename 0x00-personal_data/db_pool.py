@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Module for pooling database connections
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+
+def is_healthy(connection: Any) -> bool:
+    """
+    Check that a connection is still usable, using is_connected()
+    when the driver has it and a "SELECT 1" round trip otherwise.
+    """
+    try:
+        if hasattr(connection, "is_connected"):
+            return bool(connection.is_connected())
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled connection: close() hands it
+    back to the pool instead of closing it.
+    """
+
+    def __init__(self, pool: "ConnectionPool", connection: Any):
+        """
+        Initialize the proxy.
+        """
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name: str) -> Any:
+        """
+        Delegate everything else to the wrapped connection.
+        """
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        """
+        Return the connection to its pool; later calls do nothing.
+        """
+        if self._connection is not None:
+            self._pool.release(self._connection)
+            self._connection = None
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections created by a connect callable
+    and health-checked each time they are borrowed.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = 5,
+                 timeout: Optional[float] = None,
+                 check: Callable[[Any], bool] = is_healthy):
+        """
+        Initialize the pool; connections are opened lazily,
+        at most size of them at a time.
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.size = size
+        self.timeout = timeout
+        self._connect = connect
+        self._check = check
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self) -> Any:
+        """
+        Borrow a healthy connection, reusing an idle one when possible.
+        Raises TimeoutError if none frees up within the timeout.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No database connection available")
+        try:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._check(connection):
+                    return connection
+                self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection: Any) -> None:
+        """
+        Give a borrowed connection back to the pool.
+        """
+        self._idle.put(connection)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Context manager borrowing a connection for the block.
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def get(self) -> PooledConnection:
+        """
+        Borrow a connection whose close() returns it to the pool.
+        """
+        return PooledConnection(self, self.acquire())
+
+    def close(self) -> None:
+        """
+        Close every idle connection.
+        """
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def _discard(connection: Any) -> None:
+        """
+        Close a connection, ignoring errors from a dead one.
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
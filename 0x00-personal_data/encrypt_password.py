@@ -3,29 +3,76 @@
 Module for encrypting passwords
 """
 
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+
 import bcrypt
 
+LATENCY_WINDOW = 10000
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+CALIBRATION_ROUNDS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+_pool_size = int(os.environ.get("BCRYPT_POOL_SIZE", os.cpu_count() or 1))
+_rounds = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
 
-def hash_password(password):
+def calibrate_rounds(target_ms: float, minimum: int = 10) -> int:
     """
-    One string argument name password and return a
-    salted, hashed password, which is a byte string
+    Benchmarks bcrypt on this host and returns the highest cost
+    whose hash time fits in target_ms, but never less than minimum.
     """
-    salted = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode(), salted)
-    return hashed_password
+    password = b"calibration"
+    salt = bcrypt.gensalt(rounds=CALIBRATION_ROUNDS)
+    elapsed = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(password, salt)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    rounds = CALIBRATION_ROUNDS
+    while (rounds < MAX_ROUNDS and
+           elapsed * 2 ** (rounds + 1 - CALIBRATION_ROUNDS) * 1000
+           <= target_ms):
+        rounds += 1
+    return max(minimum, min(rounds, MAX_ROUNDS))
 
 
-def is_valid(hashed_password, password):
+def set_rounds(rounds: int) -> None:
     """
-    Check validity of password and
-    return a boolean"""
-    return bcrypt.checkpw(password.encode(), hashed_password)
+    Set the bcrypt cost used for new hashes
+    """
+    global _rounds
+    if not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+        raise ValueError("Invalid bcrypt cost: {}".format(rounds))
+    _rounds = rounds
 
 
-"""
-Module for encrypting passwords
-"""
+def get_rounds() -> int:
+    """
+    Returns the bcrypt cost used for new hashes
+    """
+    return _rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    Returns the cost a bcrypt hash was created with
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """
+    Returns True when a hash was not created with the current cost
+    """
+    return hash_rounds(hashed_password) != _rounds
 
 
 def hash_password(password: str) -> bytes:
@@ -33,7 +80,7 @@ def hash_password(password: str) -> bytes:
     Hashes the provided password using bcrypt
     and returns the new password
     """
-    salted_password = bcrypt.gensalt()
+    salted_password = bcrypt.gensalt(rounds=_rounds)
     hashed_password = bcrypt.hashpw(password.encode(), salted_password)
     return hashed_password
 
@@ -44,3 +91,147 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     and returns a boolean
     """
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+class LatencyTracker:
+    """
+    Keeps the latest call latencies of one operation.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        """
+        Initialize the tracker with a bounded window of samples.
+        """
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        """
+        Record the latency of one call.
+        """
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the call count and the mean, p50, p99 and max
+        latencies in seconds over the window.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return {"count": count}
+        return {
+            "count": count,
+            "mean": sum(samples) / len(samples),
+            "p50": samples[int(0.50 * (len(samples) - 1))],
+            "p99": samples[int(0.99 * (len(samples) - 1))],
+            "max": samples[-1],
+        }
+
+
+LATENCY = {"hash": LatencyTracker(), "check": LatencyTracker()}
+
+
+def _timed(kind: str, func: Callable, *args):
+    """
+    Call func(*args) and record its latency under kind.
+    """
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        LATENCY[kind].record(time.perf_counter() - start)
+
+
+def set_pool_size(size: int) -> None:
+    """
+    Set the number of threads used by the batch and async
+    functions; the current pool is shut down and replaced.
+    """
+    global _executor, _pool_size
+    if size < 1:
+        raise ValueError("Pool size must be at least 1")
+    with _executor_lock:
+        old, _executor, _pool_size = _executor, None, size
+    if old is not None:
+        old.shutdown(wait=True)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the shared thread pool, bcrypt releasing the GIL
+    while it hashes.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_pool_size,
+                                           thread_name_prefix="bcrypt")
+        return _executor
+
+
+def hash_passwords(passwords: Iterable[str]) -> List[bytes]:
+    """
+    Hashes many passwords concurrently and returns
+    the hashes in the same order
+    """
+    executor = _get_executor()
+    return list(executor.map(
+        lambda password: _timed("hash", hash_password, password),
+        passwords))
+
+
+def are_valid(pairs: Iterable[Tuple[bytes, str]]) -> List[bool]:
+    """
+    Checks many (hashed_password, password) pairs concurrently
+    and returns the results in the same order
+    """
+    executor = _get_executor()
+    return list(executor.map(
+        lambda pair: _timed("check", is_valid, *pair), pairs))
+
+
+async def hash_password_async(password: str) -> bytes:
+    """
+    Awaitable hash_password running on the shared pool
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), _timed, "hash", hash_password, password)
+
+
+async def is_valid_async(hashed_password: bytes, password: str) -> bool:
+    """
+    Awaitable is_valid running on the shared pool
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), _timed, "check", is_valid, hashed_password, password)
+
+
+def rehash_if_needed(hashed_password: bytes, password: str) -> bytes:
+    """
+    Checks a password and, when it matches a hash made with another
+    cost, returns a new hash at the current cost; returns None when
+    the password is invalid and the old hash when it is current
+    """
+    if not is_valid(hashed_password, password):
+        return None
+    if needs_rehash(hashed_password):
+        return hash_password(password)
+    return hashed_password
+
+
+def latency_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Returns the latency statistics of pooled hashes and checks
+    """
+    return {kind: tracker.stats() for kind, tracker in LATENCY.items()}
+
+
+if os.environ.get("BCRYPT_TARGET_MS"):
+    set_rounds(calibrate_rounds(float(os.environ["BCRYPT_TARGET_MS"])))
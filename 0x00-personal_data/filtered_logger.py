@@ -4,9 +4,15 @@ Module for filtering log data
 """
 
 import re
-from typing import List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import (Callable, Iterator, List, Mapping, Sequence, TextIO,
+                    Union)
 import logging
 import os
+import threading
+import time
 import mysql.connector
 
 patterns = {
@@ -15,6 +21,32 @@ patterns = {
 }
 
 
+REDACTOR_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=REDACTOR_CACHE_SIZE)
+def _compile_redactor(
+        fields: tuple, separator: str, redaction: str
+) -> Callable[[str], str]:
+    """
+    Build the redaction function for one (fields, separator, redaction)
+    combination; results are kept in a bounded LRU cache.
+    """
+    extract, replace = (patterns["extract"], patterns["replace"])
+    matcher = re.compile(extract(fields, separator))
+    return partial(matcher.sub, replace(redaction))
+
+
+def get_redactor(
+        fields: Sequence[str], redaction: str, separator: str
+) -> Callable[[str], str]:
+    """
+    Returns a function obfuscating the given fields of a message,
+    compiled once and reused for identical arguments.
+    """
+    return _compile_redactor(tuple(fields), separator, redaction)
+
+
 def filter_datum(
         fields: List[str], redaction: str, message: str, separator: str
 ) -> str:
@@ -22,8 +54,7 @@ def filter_datum(
     use a regex to replace occurrences of certain field values
     and returns the log message obfuscated.
     """
-    extract, replace = (patterns["extract"], patterns["replace"])
-    return re.sub(extract(fields, separator), replace(redaction), message)
+    return get_redactor(fields, redaction, separator)(message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -39,30 +70,77 @@ class RedactingFormatter(logging.Formatter):
         """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self._field_set = frozenset(fields)
+        self._redact = get_redactor(fields, self.REDACTION, self.SEPARATOR)
+
+    def render_fields(self, data: Mapping) -> str:
+        """
+        Render field/value pairs as "field=value;" with the
+        values of PII keys replaced by the redaction.
+        """
+        redaction, separator = self.REDACTION, self.SEPARATOR
+        return "".join(
+            "{}={}{}".format(
+                key, redaction if key in self._field_set else value,
+                separator)
+            for key, value in data.items())
 
     def format(self, record: logging.LogRecord) -> str:
         """
         Return filtered values in incoming log records
-        using filter_datum.
+        using the redactor compiled at initialization.
+
+        Structured records (a dict message, or a dict passed as
+        extra={"fields": ...}) are masked by key before rendering,
+        without scanning the formatted line unless a traceback or
+        stack is attached to it.
         """
-        log_message = super(RedactingFormatter, self).format(record)
-        filtered_log = filter_datum(self.fields,
-                                    self.REDACTION,
-                                    log_message,
-                                    self.SEPARATOR)
-        return filtered_log
+        if isinstance(record.msg, Mapping):
+            text, data = "", record.msg
+        elif isinstance(getattr(record, "fields", None), Mapping):
+            text = self._redact(record.getMessage()) + self.SEPARATOR
+            data = record.fields
+        else:
+            log_message = super(RedactingFormatter, self).format(record)
+            return self._redact(log_message)
+        structured = logging.makeLogRecord(record.__dict__)
+        structured.msg = text + self.render_fields(data)
+        structured.args = None
+        log_message = super(RedactingFormatter, self).format(structured)
+        if structured.exc_text or structured.stack_info:
+            return self._redact(log_message)
+        return log_message
 
 
-def get_logger() -> logging.Logger:
+def get_logger(queued: bool = None, max_queue: int = None,
+               overflow: str = None) -> logging.Logger:
     """
     Returns a logging.Logger object with specified configurations.
+
+    In queued mode the caller only enqueues records; a background
+    worker redacts, batches and writes them. The queue size and the
+    overflow policy (block, drop-oldest or sample) default to the
+    PERSONAL_DATA_LOG_* environment variables.
     """
+    if queued is None:
+        queued = os.environ.get("PERSONAL_DATA_LOG_QUEUED", "0") == "1"
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
-    stream_handler = logging.StreamHandler()
     formatter = RedactingFormatter(fields=PII_FIELDS)
+    if queued:
+        from log_pipeline import attach_queued_handler
+        if max_queue is None:
+            max_queue = int(os.environ.get("PERSONAL_DATA_LOG_QUEUE_SIZE",
+                                           "10000"))
+        if overflow is None:
+            overflow = os.environ.get("PERSONAL_DATA_LOG_OVERFLOW", "block")
+        attach_queued_handler(logger, formatter,
+                              max_size=max_queue, overflow=overflow)
+        return logger
+
+    stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
 
     logger.addHandler(stream_handler)
@@ -72,12 +150,9 @@ def get_logger() -> logging.Logger:
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+def _connect() -> mysql.connector.connection.MySQLConnection:
     """
-    Returns a connector to the database.
-
-    Returns:
-        A mysql.connector.connection.MySQLConnection object.
+    Opens a new connection from the PERSONAL_DATA_DB_* variables.
     """
     username = os.environ.get("PERSONAL_DATA_DB_USERNAME", "root")
     password = os.environ.get("PERSONAL_DATA_DB_PASSWORD", "")
@@ -92,24 +167,162 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     )
 
 
-def main() -> None:
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """
+    Returns the process-wide connection pool, sized by
+    PERSONAL_DATA_DB_POOL_SIZE and PERSONAL_DATA_DB_POOL_TIMEOUT.
+    """
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            from db_pool import ConnectionPool
+            size = int(os.environ.get("PERSONAL_DATA_DB_POOL_SIZE", "5"))
+            timeout = os.environ.get("PERSONAL_DATA_DB_POOL_TIMEOUT")
+            _db_pool = ConnectionPool(
+                _connect, size=size,
+                timeout=float(timeout) if timeout else None)
+        return _db_pool
+
+
+def get_db(
+        pooled: bool = None
+) -> mysql.connector.connection.MySQLConnection:
+    """
+    Returns a connector to the database.
+
+    In pooled mode (the default when PERSONAL_DATA_DB_POOL_SIZE is set)
+    the connection is borrowed from get_db_pool() and close() returns
+    it to the pool. Use get_db_pool().connection() as a context manager.
+
+    Returns:
+        A mysql.connector.connection.MySQLConnection object.
+    """
+    if pooled is None:
+        pooled = "PERSONAL_DATA_DB_POOL_SIZE" in os.environ
+    if pooled:
+        return get_db_pool().get()
+    return _connect()
+
+
+def format_row(columns: Sequence[str], row: Sequence) -> str:
+    """
+    Returns a row as a "field=value; ..." log message.
+    """
+    return "; ".join(
+        [f"{field}={str(value)}" for field, value in zip(columns, row)])
+
+
+def iter_row_batches(cursor, batch_size: int) -> Iterator[List[tuple]]:
+    """
+    Yields the rows of an executed query in lists of at most
+    batch_size rows, using fetchmany so only one batch is in memory.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+@lru_cache(maxsize=1)
+def _export_formatter() -> RedactingFormatter:
+    """
+    Returns the formatter used by export workers, one per process.
+    """
+    return RedactingFormatter(fields=PII_FIELDS)
+
+
+def redact_rows(columns: Sequence[str], rows: List[tuple]) -> List[str]:
+    """
+    Returns the redacted log lines for a batch of rows,
+    formatted as the user_data logger would.
+    """
+    formatter = _export_formatter()
+    lines = []
+    for row in rows:
+        record = logging.LogRecord("user_data", logging.INFO, None, None,
+                                   format_row(columns, row), None, None)
+        lines.append(formatter.format(record))
+    return lines
+
+
+def export_parallel(output: Union[str, TextIO], batch_size: int = None,
+                    workers: int = None) -> dict:
+    """
+    Export the users table, redacted, to a file path or stream.
+
+    Row batches are redacted on a process pool and written back in
+    their original order; at most two batches per worker are in
+    flight. Returns the row count, elapsed seconds and rows per second.
+    """
+    if batch_size is None:
+        batch_size = int(os.environ.get("PERSONAL_DATA_BATCH_SIZE", "1000"))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stream = open(output, "w") if isinstance(output, str) else output
+    db = get_db()
+    cursor = db.cursor(buffered=False)
+    start = time.perf_counter()
+    count = 0
+    try:
+        cursor.execute("SELECT * FROM users")
+        columns = tuple(cursor.column_names)
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for rows in iter_row_batches(cursor, batch_size):
+                pending.append(executor.submit(redact_rows, columns, rows))
+                count += len(rows)
+                if len(pending) >= 2 * workers:
+                    stream.write("\n".join(pending.popleft().result()))
+                    stream.write("\n")
+            while pending:
+                stream.write("\n".join(pending.popleft().result()))
+                stream.write("\n")
+        stream.flush()
+    finally:
+        cursor.close()
+        db.close()
+        if stream is not output:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": count,
+        "seconds": elapsed,
+        "rows_per_second": count / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(stream: bool = None, batch_size: int = None) -> None:
     """
     obtain a database connection using get_db and retrieve all
     rows in the users table and display each row under a filtered format
+
+    In streaming mode rows are read through an unbuffered cursor in
+    batches of batch_size (PERSONAL_DATA_BATCH_SIZE) and logged as each
+    batch arrives, so memory does not grow with the table.
     """
+    if stream is None:
+        stream = os.environ.get("PERSONAL_DATA_STREAM", "0") == "1"
+    if batch_size is None:
+        batch_size = int(os.environ.get("PERSONAL_DATA_BATCH_SIZE", "1000"))
     logger = get_logger()
     db = get_db()
-    cursor = db.cursor()
+    cursor = db.cursor(buffered=False) if stream else db.cursor()
     cursor.execute("SELECT * FROM users")
-    rows = cursor.fetchall()
 
     logger.info("Filtered fields:\n%s", "\n".join(PII_FIELDS))
 
-    for row in rows:
-        log_message = "; ".join(
-            [f"{field}={str(value)}" for field,
-             value in zip(cursor.column_names, row)])
-        logger.info(log_message)
+    if stream:
+        batches = iter_row_batches(cursor, batch_size)
+    else:
+        batches = iter([cursor.fetchall()])
+    for rows in batches:
+        for row in rows:
+            logger.info(format_row(cursor.column_names, row))
 
     cursor.close()
     db.close()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Module for queued, non-blocking logging
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import List, Optional, TextIO
+
+OVERFLOW_POLICIES = ("block", "drop-oldest", "sample")
+BLOCK_POLL = 0.1
+
+
+class QueuedRedactingHandler(logging.handlers.QueueHandler):
+    """
+    Handler that only enqueues records; formatting and writing
+    are left to a BatchingListener running on a background thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "block",
+                 sample_every: int = 10):
+        """
+        Initialize the handler with a bounded queue and
+        the policy applied when that queue is full.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: {}".format(overflow))
+        super(QueuedRedactingHandler, self).__init__(log_queue)
+        self.overflow = overflow
+        self.sample_every = max(1, sample_every)
+        self.dropped = 0
+        self.listener = None
+        self._overflowed = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Keep the record as is: the message is rendered and
+        redacted by the listener, not on the calling thread.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Put a record on the queue, applying the overflow policy
+        when the queue is full; once the listener is stopped the
+        record is written synchronously instead.
+        """
+        listener = self.listener
+        if listener is not None and listener.stopped():
+            listener.write_now(record)
+            return
+        if self.overflow == "block":
+            while True:
+                try:
+                    self.queue.put(record, timeout=BLOCK_POLL)
+                    return
+                except queue.Full:
+                    if listener is not None and listener.stopped():
+                        listener.write_now(record)
+                        return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "sample":
+            self._overflowed += 1
+            if self._overflowed % self.sample_every != 0:
+                self.dropped += 1
+                return
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                continue
+
+
+class BatchingListener:
+    """
+    Background worker formatting queued records and writing
+    them to a stream in batches.
+    """
+
+    def __init__(self, log_queue: queue.Queue, formatter: logging.Formatter,
+                 stream: Optional[TextIO] = None, batch_size: int = 256,
+                 flush_interval: float = 0.5):
+        """
+        Initialize the listener; call start() to run the worker.
+        """
+        self.queue = log_queue
+        self.formatter = formatter
+        self.stream = stream if stream is not None else sys.stderr
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._thread = None
+        self._stopping = threading.Event()
+        self._write_lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Start the worker thread.
+        """
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="user_data-log-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def stopped(self) -> bool:
+        """
+        Return True once stop() has been called.
+        """
+        return self._stopping.is_set()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Drain the queue, flush the pending lines and wait
+        at most timeout seconds for the worker to exit; records
+        queued after that are written by the caller.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.write_now(record)
+
+    def write_now(self, record: logging.LogRecord) -> None:
+        """
+        Format and write one record on the calling thread.
+        """
+        line = self._format(record)
+        if line is not None:
+            self._write([line])
+
+    def _write(self, lines: List[str]) -> None:
+        """
+        Write a batch of formatted lines and flush the stream.
+        """
+        if not lines:
+            return
+        try:
+            with self._write_lock:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+        except Exception:
+            pass
+        lines.clear()
+
+    def _format(self, record: logging.LogRecord) -> Optional[str]:
+        """
+        Format one record, dropping it if formatting fails.
+        """
+        try:
+            return self.formatter.format(record)
+        except Exception:
+            return None
+
+    def _run(self) -> None:
+        """
+        Worker loop: collect records into batches and write a batch
+        when it is full, the queue runs dry or the interval expires.
+        """
+        lines = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stopping.is_set():
+            timeout = self.flush_interval
+            if lines:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            if record is not None:
+                line = self._format(record)
+                if line is not None:
+                    lines.append(line)
+            if (len(lines) >= self.batch_size or self.queue.empty()
+                    or time.monotonic() >= deadline):
+                self._write(lines)
+                deadline = time.monotonic() + self.flush_interval
+        for _ in range(self.queue.qsize()):
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            line = self._format(record)
+            if line is not None:
+                lines.append(line)
+        self._write(lines)
+
+
+def attach_queued_handler(logger: logging.Logger,
+                          formatter: logging.Formatter,
+                          max_size: int = 10000,
+                          overflow: str = "block",
+                          batch_size: int = 256,
+                          stream: Optional[TextIO] = None
+                          ) -> BatchingListener:
+    """
+    Attach a queued handler to a logger and start its listener,
+    which is flushed and stopped at interpreter exit.
+    """
+    log_queue = queue.Queue(maxsize=max_size)
+    handler = QueuedRedactingHandler(log_queue, overflow=overflow)
+    listener = BatchingListener(log_queue, formatter,
+                                stream=stream, batch_size=batch_size)
+    handler.listener = listener
+    logger.addHandler(handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
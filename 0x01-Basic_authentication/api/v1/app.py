@@ -3,9 +3,11 @@
 Route module for the API
 """
 from os import getenv
+import time
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, g, request
 from flask_cors import CORS
+from api.v1 import metrics, profiling
 from api.v1.auth.auth import Auth
 from api.v1.auth.basic_auth import BasicAuth
 
@@ -22,6 +24,54 @@ if auth_type == "basic_auth":
 else:
     auth = Auth()
 
+excluded_paths = [
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/'
+]
+if getenv("AUTH_EXCLUDED_PATHS"):
+    excluded_paths = [path.strip() for path
+                      in getenv("AUTH_EXCLUDED_PATHS").split(",")
+                      if path.strip()]
+if getenv("AUTH_METRICS_PUBLIC", "0") == "1":
+    excluded_paths.append('/api/v1/metrics/')
+excluded_set = frozenset(excluded_paths)
+
+
+@app.before_request
+def start_timer():
+    """Start timing the request for the metrics
+    """
+    g.metrics_start = time.perf_counter()
+
+
+@app.after_request
+def record_metrics(response):
+    """Count the request and its latency by route and status
+    """
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        rule = request.url_rule
+        metrics.observe_request(request.method,
+                                rule.rule if rule else "unmatched",
+                                response.status_code,
+                                time.perf_counter() - start)
+    return response
+
+
+if profiling.ENABLED:
+    @app.before_request
+    def start_profiling():
+        """Start cProfile on sampled requests
+        """
+        g.profiler = profiling.start_request()
+
+    @app.teardown_request
+    def end_profiling(error=None):
+        """Collect the cProfile stats of sampled requests
+        """
+        profiling.end_request(g.pop('profiler', None))
+
 
 @app.before_request
 def before_request():
@@ -30,18 +80,17 @@ def before_request():
     if auth is None:
         return
 
-    excluded_paths = [
-        '/api/v1/status/',
-        '/api/v1/unauthorized/',
-        '/api/v1/forbidden/'
-    ]
-
-    if request.path not in excluded_paths and auth.require_auth(request.path,
-                                                                excluded_paths
-                                                                ):
-        if auth.authorization_header(request) is None:
+    with profiling.stage("require_auth"):
+        required = request.path not in excluded_set and \
+            auth.require_auth(request.path, excluded_paths)
+    if required:
+        with profiling.stage("authorization_header"):
+            header = auth.authorization_header(request)
+        if header is None:
             abort(401)
-        if auth.current_user(request) is None:
+        with profiling.stage("current_user"):
+            user = auth.current_user(request)
+        if user is None:
             abort(403)
 
 
@@ -4,7 +4,65 @@ Auth module
 """
 import re
 from flask import request
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import List, Tuple, TypeVar
+
+
+PATH_CACHE_SIZE = 4096
+
+
+class PathMatcher:
+    """
+    Matcher of excluded paths, built once: entries ending with '*'
+    go in a prefix trie, the others in one combined regex matched
+    at the start of the path as re.match does; blank entries
+    are ignored, as an empty pattern would match every path
+    """
+
+    _END = object()
+
+    def __init__(self, excluded_paths: List[str]):
+        """
+        Compiles the excluded paths
+        """
+        self._trie = {}
+        patterns = []
+        for exclusion_path in map(lambda x: x.strip(), excluded_paths):
+            if not exclusion_path:
+                continue
+            if exclusion_path.endswith('*'):
+                node = self._trie
+                for char in exclusion_path[:-1]:
+                    node = node.setdefault(char, {})
+                node[self._END] = True
+            else:
+                patterns.append("(?:{})".format(exclusion_path))
+        self._pattern = re.compile("|".join(patterns)) if patterns else None
+        self.is_excluded = lru_cache(maxsize=PATH_CACHE_SIZE)(self._match)
+
+    def _match(self, path: str) -> bool:
+        """
+        Returns True if the path is excluded
+        """
+        node = self._trie
+        if self._END in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if self._END in node:
+                return True
+        return self._pattern is not None and \
+            self._pattern.match(path) is not None
+
+
+@lru_cache(maxsize=32)
+def get_path_matcher(excluded_paths: Tuple[str, ...]) -> PathMatcher:
+    """
+    Returns the matcher of a list of excluded paths, built once
+    """
+    return PathMatcher(list(excluded_paths))
 
 
 class Auth:
@@ -19,12 +77,9 @@ class Auth:
             True if authentication is required, False otherwise
         """
         if path is not None and excluded_paths is not None:
-            for exclusion_path in map(lambda x: x.strip(), excluded_paths):
-                if exclusion_path.endswith('*'):
-                    if path.startswith(exclusion_path[:-1]):
-                        return False
-                elif re.match(exclusion_path, path):
-                    return False
+            matcher = get_path_matcher(tuple(excluded_paths))
+            if matcher.is_excluded(path):
+                return False
         return True
 
     def authorization_header(self, request=None) -> str:
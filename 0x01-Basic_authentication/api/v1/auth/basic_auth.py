@@ -3,16 +3,110 @@
 BasicAuth module
 """
 import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
 from api.v1.auth.auth import Auth
-from typing import Tuple, TypeVar
+from api.v1.profiling import stage
+from typing import Optional, Tuple, TypeVar
 from models.user import User
 
 
+class CredentialCache:
+    """
+    Bounded TTL cache of verified Authorization headers.
+    Keys are keyed digests of the header and entries hold the user id
+    and a digest of its email and stored password hash, never the
+    credentials
+    """
+
+    def __init__(self, size: int = 1024, ttl: float = 60.0):
+        """
+        Initializes the cache with a random per-process digest key
+        """
+        self.size = size
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, value: str) -> bytes:
+        """
+        Returns the keyed SHA-256 digest of a value
+        """
+        return hmac.new(self._key, value.encode(), hashlib.sha256).digest()
+
+    def _fingerprint(self, user: TypeVar('User')) -> bytes:
+        """
+        Returns the digest of the email and password hash of a user
+        """
+        return self._digest("{}\0{}".format(user.email, user.password))
+
+    def get(self, header: str) -> Optional[TypeVar('User')]:
+        """
+        Returns the user verified for this header, or None when
+        unknown, expired, removed or if the email or the password
+        has changed
+        """
+        key = self._digest(header)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_id, fingerprint, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        user = User.get(user_id)
+        if user is None or user.password is None or \
+                not hmac.compare_digest(self._fingerprint(user),
+                                        fingerprint):
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return user
+
+    def put(self, header: str, user: TypeVar('User')) -> None:
+        """
+        Remembers that a header was verified for a user
+        """
+        if self.size <= 0 or user.password is None:
+            return
+        key = self._digest(header)
+        entry = (user.id, self._fingerprint(user),
+                 time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drops every entry
+        """
+        with self._lock:
+            self._entries.clear()
+
+
 class BasicAuth(Auth):
     """
     BasicAuth class that inherits from Auth
     """
 
+    def __init__(self):
+        """
+        Initializes the verified-credential cache, sized by
+        AUTH_CACHE_SIZE entries kept AUTH_CACHE_TTL seconds
+        """
+        self.credentials = CredentialCache(
+            int(os.getenv("AUTH_CACHE_SIZE", "1024")),
+            float(os.getenv("AUTH_CACHE_TTL", "60")))
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> str:
         """
@@ -72,26 +166,41 @@ class BasicAuth(Auth):
         """
         if type(user_email) == str and type(user_pwd) == str:
             try:
-                users = User.search({'email': user_email})
+                with stage("user_search"):
+                    users = User.search({'email': user_email})
             except Exception:
                 return None
             if len(users) <= 0:
                 return None
-            if users[0].is_valid_password(user_pwd):
+            with stage("password_check"):
+                valid = users[0].is_valid_password(user_pwd)
+            if valid:
                 return users[0]
         return None
 
     def current_user(self, request=None) -> TypeVar('User'):
         """
-        Retrieves the User instance for a request
+        Retrieves the User instance for a request, from the
+        verified-credential cache when the header was seen recently
         Returns:
             The User instance if authenticated, None otherwise
         """
         header = self.authorization_header(request)
-        base64_auth = self.extract_base64_authorization_header(header)
-        decoded_header = self.decode_base64_authorization_header(base64_auth)
-        email, password = self.extract_user_credentials(decoded_header)
-        return self.user_object_from_credentials(email, password)
+        if header is None:
+            return None
+        with stage("credential_cache"):
+            user = self.credentials.get(header)
+        if user is not None:
+            return user
+        with stage("base64"):
+            base64_auth = self.extract_base64_authorization_header(header)
+            decoded = self.decode_base64_authorization_header(base64_auth)
+        with stage("extract_credentials"):
+            email, password = self.extract_user_credentials(decoded)
+        user = self.user_object_from_credentials(email, password)
+        if user is not None:
+            self.credentials.put(header, user)
+        return user
 
     def extract_user_credentials(self,
                                  decoded_base64_authorization_header: str) -> Tuple[str, str]:  # nopep8
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Request and model metrics in the Prometheus text format
+
+Request counters live in per-thread shards written only by their
+own thread, so recording a request takes no lock; the shards are
+summed when the metrics are rendered.
+"""
+import bisect
+import threading
+from os import path
+from typing import Dict, List
+
+from models.storage import FileStorage, get_storage
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SHARDS = 256
+
+_local = threading.local()
+_lock = threading.Lock()
+_shards = []
+_retired = {'requests': {}, 'latency': {}}
+
+
+def _new_shard() -> Dict:
+    """
+    Registers the shard of the current thread, folding the shards
+    of finished threads when there are too many
+    """
+    shard = {'requests': {}, 'latency': {},
+             'thread': threading.current_thread()}
+    with _lock:
+        if len(_shards) >= MAX_SHARDS:
+            _fold_dead()
+        _shards.append(shard)
+    _local.shard = shard
+    return shard
+
+
+def _merge(into: Dict, shard: Dict) -> None:
+    """
+    Adds the counters of a shard to another
+    """
+    for key, value in shard['requests'].copy().items():
+        into['requests'][key] = into['requests'].get(key, 0) + value
+    for key, hist in shard['latency'].copy().items():
+        total = into['latency'].setdefault(key, [0] * (len(BUCKETS) + 3))
+        for i, value in enumerate(list(hist)):
+            total[i] += value
+
+
+def _fold_dead() -> None:
+    """
+    Moves the shards of finished threads into the retired totals;
+    the caller holds the lock
+    """
+    alive = []
+    for shard in _shards:
+        if shard['thread'].is_alive():
+            alive.append(shard)
+        else:
+            _merge(_retired, shard)
+    _shards[:] = alive
+
+
+def observe_request(method: str, route: str, status: int,
+                    seconds: float) -> None:
+    """
+    Records one request
+    """
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _new_shard()
+    key = (method, route, status)
+    requests = shard['requests']
+    requests[key] = requests.get(key, 0) + 1
+    hist = shard['latency'].get((method, route))
+    if hist is None:
+        hist = shard['latency'][(method, route)] = [0] * (len(BUCKETS) + 3)
+    hist[bisect.bisect_left(BUCKETS, seconds)] += 1
+    hist[-2] += 1
+    hist[-1] += seconds
+
+
+def _labels(**labels) -> str:
+    """
+    Formats Prometheus labels
+    """
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                          for k, v in labels.items()) + "}"
+
+
+def render(models: List = ()) -> str:
+    """
+    Returns every metric in the Prometheus text format
+    """
+    totals = {'requests': {}, 'latency': {}}
+    with _lock:
+        _merge(totals, _retired)
+        for shard in _shards:
+            _merge(totals, shard)
+
+    lines = ["# TYPE http_requests_total counter"]
+    for (method, route, status), value in sorted(totals['requests'].items()):
+        lines.append("http_requests_total{} {}".format(
+            _labels(method=method, route=route, status=status), value))
+
+    lines.append("# TYPE http_request_duration_seconds histogram")
+    for (method, route), hist in sorted(totals['latency'].items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), hist):
+            cumulative += count
+            lines.append("http_request_duration_seconds_bucket{} {}".format(
+                _labels(method=method, route=route, le=bound), cumulative))
+        lines.append("http_request_duration_seconds_sum{} {}".format(
+            _labels(method=method, route=route), hist[-1]))
+        lines.append("http_request_duration_seconds_count{} {}".format(
+            _labels(method=method, route=route), hist[-2]))
+
+    store = get_storage()
+    data = store.data if isinstance(store, FileStorage) else {}
+    lines.append("# TYPE models_data_objects gauge")
+    for s_class, objs in list(data.items()):
+        lines.append("models_data_objects{} {}".format(
+            _labels(model=s_class), len(objs)))
+    lines.append("# TYPE models_objects gauge")
+    for cls in models:
+        lines.append("models_objects{} {}".format(
+            _labels(model=cls.__name__), cls.count()))
+
+    lines.append("# TYPE models_persist_seconds_total counter")
+    lines.append("# TYPE models_persist_total counter")
+    for s_class, (count, seconds) in list(store.persist_stats.items()):
+        lines.append("models_persist_seconds_total{} {}".format(
+            _labels(model=s_class), seconds))
+        lines.append("models_persist_total{} {}".format(
+            _labels(model=s_class), count))
+
+    lines.append("# TYPE models_file_bytes gauge")
+    for s_class in list(data.keys()):
+        for kind, file_path in (
+                ("snapshot", store.file_path(s_class)),
+                ("journal", store.file_path(s_class, "journal"))):
+            if path.exists(file_path):
+                lines.append("models_file_bytes{} {}".format(
+                    _labels(model=s_class, file=kind),
+                    path.getsize(file_path)))
+
+    lines.append("# TYPE models_load_seconds gauge")
+    for s_class, stats in list(store.load_stats.items()):
+        seconds = stats['parse_seconds'] + (stats['build_seconds'] or 0.0)
+        lines.append("models_load_seconds{} {}".format(
+            _labels(model=s_class), seconds))
+    return "\n".join(lines) + "\n"
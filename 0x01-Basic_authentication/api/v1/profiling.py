@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency profiling of the request path
+
+Enabled with AUTH_PROFILE=1. Each stage wrapped in stage() is timed
+into a histogram, a fraction AUTH_PROFILE_SAMPLE of the requests is
+run under cProfile, and everything is written to AUTH_PROFILE_OUTPUT
+(JSON) and AUTH_PROFILE_OUTPUT.prof (pstats) at exit, on SIGTERM, on
+SIGUSR1 and every AUTH_PROFILE_INTERVAL seconds when that is set.
+"""
+import atexit
+import cProfile
+import json
+import os
+import pstats
+import random
+import signal
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from os import getenv
+from typing import Dict, Optional
+
+ENABLED = getenv("AUTH_PROFILE", "0") == "1"
+SAMPLE_RATE = float(getenv("AUTH_PROFILE_SAMPLE", "0"))
+OUTPUT = getenv("AUTH_PROFILE_OUTPUT", "auth_profile.json")
+INTERVAL = float(getenv("AUTH_PROFILE_INTERVAL", "0"))
+
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+_NULL = nullcontext()
+_lock = threading.RLock()
+_stats = None
+
+
+class Histogram:
+    """
+    Latency histogram with power-of-two buckets from 1us to about 16s
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty histogram
+        """
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.RLock()
+
+    def observe(self, seconds: float) -> None:
+        """
+        Records one duration
+        """
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the upper bound of the bucket holding quantile q
+        """
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return 0.0
+
+    def to_json(self) -> Dict:
+        """
+        Returns the histogram summary and buckets
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "buckets": {"{:g}".format(bound): count for bound, count
+                        in zip(BUCKETS + (float("inf"),), self.counts)},
+        }
+
+
+HISTOGRAMS = {}
+
+
+def histogram(name: str) -> Histogram:
+    """
+    Returns the histogram of a stage
+    """
+    hist = HISTOGRAMS.get(name)
+    if hist is None:
+        with _lock:
+            hist = HISTOGRAMS.setdefault(name, Histogram())
+    return hist
+
+
+@contextmanager
+def _timed(name: str):
+    """
+    Times the block into the histogram of a stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram(name).observe(time.perf_counter() - start)
+
+
+def stage(name: str):
+    """
+    Context manager timing a stage; does nothing when disabled
+    """
+    if not ENABLED:
+        return _NULL
+    return _timed(name)
+
+
+def start_request() -> Optional[cProfile.Profile]:
+    """
+    Starts cProfile for a sampled fraction of the requests
+    """
+    if not ENABLED or SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def end_request(profiler: Optional[cProfile.Profile]) -> None:
+    """
+    Stops a request profiler and adds it to the aggregated stats
+    """
+    global _stats
+    if profiler is None:
+        return
+    profiler.disable()
+    with _lock:
+        if _stats is None:
+            _stats = pstats.Stats(profiler)
+        else:
+            _stats.add(profiler)
+
+
+def dump(output: str = None) -> None:
+    """
+    Writes the histograms and the aggregated cProfile stats
+    """
+    output = output or OUTPUT
+    with _lock:
+        data = {name: hist.to_json() for name, hist in HISTOGRAMS.items()}
+        stats = _stats
+    with open(output, "w") as f:
+        json.dump(data, f, indent=2)
+    if stats is not None:
+        stats.dump_stats(output + ".prof")
+
+
+def _dump_loop() -> None:
+    """
+    Writes the results every INTERVAL seconds
+    """
+    while True:
+        time.sleep(INTERVAL)
+        dump()
+
+
+def _on_signal(signum, frame) -> None:
+    """
+    Writes the results, then lets SIGTERM go on to the handler
+    installed before this one
+    """
+    dump()
+    if signum != signal.SIGTERM:
+        return
+    previous = _previous_handlers.get(signum)
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+_previous_handlers = {}
+
+
+def install_handlers() -> None:
+    """
+    Dumps on SIGUSR1 and before SIGTERM; only possible from
+    the main thread
+    """
+    for name in ("SIGTERM", "SIGUSR1"):
+        signum = getattr(signal, name, None)
+        if signum is None or signal.getsignal(signum) is _on_signal:
+            continue
+        try:
+            _previous_handlers[signum] = signal.signal(signum, _on_signal)
+        except ValueError:
+            pass
+
+
+if ENABLED:
+    atexit.register(dump)
+    install_handlers()
+    if INTERVAL > 0:
+        threading.Thread(target=_dump_loop, name="auth-profile-dump",
+                         daemon=True).start()
@@ -2,18 +2,110 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from datetime import datetime
+from flask import Response, abort, jsonify, request
 from models.user import User
+import json
+import zlib
+
+
+PAGE_ORDERS = ('id', 'created_at')
+
+
+def encode_cursor(user: User, order: str) -> str:
+    """ Return the cursor of the page following user: its sort key
+    """
+    if order == 'id':
+        return user.id
+    return "{},{}".format(user.created_at.isoformat(), user.id)
+
+
+def decode_cursor(cursor: str, order: str):
+    """ Return the sort key carried by a cursor, or None if invalid
+    """
+    if order == 'id':
+        return (cursor,)
+    created_at, _, user_id = cursor.partition(",")
+    try:
+        created_at = datetime.fromisoformat(created_at)
+    except ValueError:
+        return None
+    if created_at.tzinfo is not None:
+        return None
+    return (created_at, user_id)
+
+
+def not_modified(etag: str):
+    """ Return a 304 response if the request already has etag
+    """
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def stream_users(users):
+    """ Yield a list of users as a JSON array, one user at a time
+    """
+    yield '['
+    for i, user in enumerate(users):
+        yield (',' if i else '') + json.dumps(user.to_json())
+    yield ']\n'
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (all optional):
+      - limit: maximum number of users returned
+      - after: cursor of the previous page, from X-Next-Cursor
+      - order: "id" (default) or "created_at"
+      - stream: "1" to write the JSON array incrementally
     Return:
       - list of all User objects JSON represented
+      - X-Next-Cursor header with the "after" of the next page
+      - 304 if If-None-Match has the current ETag
+      - 400 if a parameter is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    etag = "users-{}-{:x}".format(User.version(),
+                                  zlib.crc32(request.query_string))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    order = request.args.get('order', 'id')
+    if order not in PAGE_ORDERS:
+        return jsonify({'error': "Invalid order"}), 400
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 1:
+            return jsonify({'error': "Invalid limit"}), 400
+
+    last_key = None
+    if after is not None:
+        last_key = decode_cursor(after, order)
+        if last_key is None:
+            return jsonify({'error': "Invalid cursor"}), 400
+
+    next_cursor = None
+    users = User.page(order, last_key, None if limit is None else limit + 1)
+    if limit is not None and len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1], order)
+
+    if request.args.get('stream') == '1':
+        response = Response(stream_users(users), mimetype='application/json')
+    else:
+        response = jsonify([user.to_json() for user in users])
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -23,6 +115,7 @@ def view_one_user(user_id: str = None) -> str:
       - User ID
     Return:
       - User object JSON represented
+      - 304 if If-None-Match has the current ETag
       - 404 if the User ID doesn't exist
     """
     if user_id is None:
@@ -30,7 +123,13 @@ def view_one_user(user_id: str = None) -> str:
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    etag = "{}-{}".format(user.id, user.revision())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    response = jsonify(user.to_json())
+    response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -120,3 +219,91 @@ def update_user(user_id: str = None) -> str:
         user.last_name = rj.get('last_name')
     user.save()
     return jsonify(user.to_json()), 200
+
+
+def validate_operation(op, seen: set):
+    """ Return the error of one bulk operation, or None
+    """
+    if not isinstance(op, dict):
+        return "Wrong format"
+    for field in ("email", "password", "first_name", "last_name"):
+        if op.get(field) is not None and not isinstance(op.get(field), str):
+            return "{} must be a string".format(field)
+    kind = op.get("op")
+    if kind == "create":
+        if op.get("email", "") == "":
+            return "email missing"
+        if op.get("password", "") == "":
+            return "password missing"
+        return None
+    if kind not in ("update", "delete"):
+        return "op must be create, update or delete"
+    user_id = op.get("id")
+    if not isinstance(user_id, str) or User.get(user_id) is None:
+        return "User not found"
+    if user_id in seen:
+        return "User already in the batch"
+    seen.add(user_id)
+    return None
+
+
+def apply_operation(op):
+    """ Apply one validated bulk operation, return its result
+    """
+    kind = op.get("op")
+    if kind == "create":
+        user = User()
+        user.email = op.get("email")
+        user.password = op.get("password")
+        user.first_name = op.get("first_name")
+        user.last_name = op.get("last_name")
+        user.save()
+        return {'status': 201, 'user': user.to_json()}
+    user = User.get(op.get("id"))
+    if kind == "delete":
+        user.remove()
+        return {'status': 200, 'id': user.id}
+    if op.get('first_name') is not None:
+        user.first_name = op.get('first_name')
+    if op.get('last_name') is not None:
+        user.last_name = op.get('last_name')
+    if op.get('password'):
+        user.password = op.get('password')
+    user.save()
+    return {'status': 200, 'user': user.to_json()}
+
+
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def bulk_users() -> str:
+    """ POST /api/v1/users/bulk
+    JSON body:
+      - list of operations, each one of:
+        - {"op": "create", "email", "password",
+           "first_name" (optional), "last_name" (optional)}
+        - {"op": "update", "id", "first_name" (optional),
+           "last_name" (optional), "password" (optional)}
+        - {"op": "delete", "id"}
+    Every operation is validated before any is applied, and the
+    store is persisted once for the whole batch.
+    Return:
+      - list of results, one per operation, in order
+      - 400 with the errors by index if any operation is invalid
+    """
+    try:
+        ops = request.get_json()
+    except Exception as e:
+        ops = None
+    if not isinstance(ops, list):
+        return jsonify({'error': "Wrong format"}), 400
+    seen = set()
+    errors = []
+    for i, op in enumerate(ops):
+        error_msg = validate_operation(op, seen)
+        if error_msg is not None:
+            errors.append({'index': i, 'error': error_msg})
+    if errors:
+        return jsonify({'error': "Invalid operations",
+                        'errors': errors}), 400
+    with User.batch():
+        results = [apply_operation(op) for op in ops]
+    return jsonify(results), 200
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+""" Memory benchmark of resident User objects
+
+Usage:
+    ./bench_memory.py [--users 1000000]
+"""
+import argparse
+import gc
+import tracemalloc
+from datetime import datetime
+
+from models.user import User
+
+
+class PlainUser():
+    """ Reference object keeping the same attributes in a __dict__
+    """
+
+    def __init__(self, **kwargs):
+        """ Initialize a PlainUser instance
+        """
+        self.id = kwargs['id']
+        self.created_at = datetime.utcnow()
+        self.updated_at = datetime.utcnow()
+        self.email = kwargs.get('email')
+        self._password = kwargs.get('_password')
+        self.first_name = kwargs.get('first_name')
+        self.last_name = kwargs.get('last_name')
+
+
+def measure(cls, count: int) -> float:
+    """ Return the bytes allocated per object when keeping count
+        objects of cls in a dict, as FileStorage does
+    """
+    gc.collect()
+    tracemalloc.start()
+    objs = {}
+    for i in range(count):
+        obj_id = "{:036d}".format(i)
+        objs[obj_id] = cls(id=obj_id, email="user{}@example.com".format(i),
+                           _password="0" * 64, first_name="First",
+                           last_name="Last")
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    objs.clear()
+    return used / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="User memory benchmark")
+    parser.add_argument("--users", type=int, default=1000000)
+    args = parser.parse_args()
+
+    for cls in (User, PlainUser):
+        per_object = measure(cls, args.users)
+        print("{:<10} {:>8.0f} B/user {:>10.1f} MiB for {} users".format(
+            cls.__name__, per_object, per_object * args.users / 2 ** 20,
+            args.users))
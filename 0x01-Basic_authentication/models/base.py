@@ -3,35 +3,36 @@
 """
 from datetime import datetime
 from typing import TypeVar, List, Iterable
-from os import path
-import json
+from models.storage import TIMESTAMP_FORMAT, Storage, get_storage
+import atexit
+import operator
 import uuid
 
 
-TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+SLOTS = {}
+GETTERS = {}
 
 
 class Base():
     """ Base class
     """
 
+    __slots__ = ('id', 'created_at', 'updated_at', '_revision')
+    __transient__ = ('_revision',)
+    __indexes__ = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
-        self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
+        created_at = kwargs.get('created_at')
+        if created_at is not None:
+            self.created_at = datetime.fromisoformat(created_at)
         else:
             self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+        updated_at = kwargs.get('updated_at')
+        if updated_at is not None:
+            self.updated_at = datetime.fromisoformat(updated_at)
         else:
             self.updated_at = datetime.utcnow()
 
@@ -46,9 +47,35 @@ class Base():
 
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+
+            The public form is kept in the json_cache of the storage,
+            by id and revision, and used while the attribute values
+            it was built from are unchanged
+        """
+        if for_serialization or hasattr(self, '__dict__'):
+            return self._to_json(for_serialization)
+        cls = self.__class__
+        getter = GETTERS.get(cls)
+        if getter is None:
+            getter = GETTERS[cls] = operator.attrgetter(*cls.slot_names())
+        try:
+            values = getter(self)
+        except AttributeError:
+            return self._to_json(False)
+        cache = cls.storage().json_cache
+        key = (cls.__name__, self.id, self.revision())
+        cached = cache.get(key)
+        if cached is not None and cached[0] == values:
+            return dict(cached[1])
+        result = self._to_json(False)
+        cache.put(key, (values, dict(result)))
+        return result
+
+    def _to_json(self, for_serialization: bool) -> dict:
+        """ Build the JSON dictionary of the object
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self.attributes():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,56 +84,104 @@ class Base():
                 result[key] = value
         return result
 
+    def revision(self) -> int:
+        """ Return the revision of the object, which changes
+            every time it is loaded or saved
+        """
+        return getattr(self, '_revision', 0)
+
+    @classmethod
+    def version(cls) -> int:
+        """ Return the version of the class collection, which changes
+            every time it is loaded or one of its objects is
+            saved or removed
+        """
+        return cls.storage().version(cls)
+
+    @classmethod
+    def slot_names(cls) -> tuple:
+        """ Return the names of the persistent slots of the class,
+            in declaration order
+        """
+        names = SLOTS.get(cls)
+        if names is None:
+            names = tuple(name for klass in reversed(cls.__mro__)
+                          for name in klass.__dict__.get('__slots__', ())
+                          if name not in ('__dict__', '__weakref__') and
+                          name not in cls.__transient__)
+            SLOTS[cls] = names
+        return names
+
+    def attributes(self) -> Iterable[tuple]:
+        """ Iterate over the (name, value) pairs of the attributes
+            set on the object, slots first, in declaration order
+        """
+        for name in self.slot_names():
+            try:
+                yield name, getattr(self, name)
+            except AttributeError:
+                continue
+        if hasattr(self, '__dict__'):
+            yield from self.__dict__.items()
+
+    @classmethod
+    def storage(cls) -> Storage:
+        """ Return the storage backend of the class
+        """
+        return get_storage()
+
     @classmethod
-    def load_from_file(cls):
-        """ Load all objects from file
+    def load_from_file(cls, lazy: bool = None):
+        """ Load all objects from the storage
+
+            With the file storage and lazy (MODELS_LAZY_LOAD=1) only
+            the JSON is parsed; objects are built on first access.
+            Timings are kept in the load_stats of the storage.
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        cls.storage().load(cls, lazy)
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def objects(cls) -> dict:
+        """ Return the objects of the class by id
+        """
+        return cls.storage().objects(cls)
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Save all objects to the storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        cls.storage().persist(cls)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @staticmethod
+    def flush():
+        """ Persist every pending mutation
+        """
+        get_storage().flush()
+
+    @staticmethod
+    def batch():
+        """ Context manager grouping the writes of its block:
+            deferred until the outermost block exits with the file
+            storage, one transaction of the thread with SQLite
+        """
+        return get_storage().batch()
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        self.__class__.storage().save(self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        self.__class__.storage().remove(self)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return cls.storage().count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,20 +193,21 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return cls.storage().get(cls, id)
+
+    @classmethod
+    def page(cls, order: str = 'id', after: tuple = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return objects sorted by order then id, after the sort
+            key after, at most limit of them
+        """
+        return cls.storage().page(cls, order, after, limit)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return cls.storage().search(cls, attributes)
+
+
+atexit.register(Base.flush)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+""" Index module
+"""
+from typing import Iterable, List, Optional
+
+
+class Index():
+    """ Hash indexes on some attributes of the objects of one class,
+        mapping each attribute value to the ids holding it
+    """
+
+    def __init__(self, attributes: Iterable[str]):
+        """ Initialize an Index instance
+        """
+        self.attributes = tuple(attributes)
+        self._maps = {attr: {} for attr in self.attributes}
+        self._values = {}
+
+    def clear(self):
+        """ Drop every entry
+        """
+        for attr in self.attributes:
+            self._maps[attr] = {}
+        self._values = {}
+
+    def add(self, obj):
+        """ Index an object, replacing its previous entries
+        """
+        self.discard(obj.id)
+        values = {}
+        for attr in self.attributes:
+            value = getattr(obj, attr, None)
+            try:
+                ids = self._maps[attr].setdefault(value, {})
+            except TypeError:
+                continue
+            ids[obj.id] = None
+            values[attr] = value
+        self._values[obj.id] = values
+
+    def discard(self, obj_id: str):
+        """ Remove the entries of an object id
+        """
+        values = self._values.pop(obj_id, None)
+        if values is None:
+            return
+        for attr, value in values.items():
+            ids = self._maps[attr].get(value)
+            if ids is None:
+                continue
+            ids.pop(obj_id, None)
+            if len(ids) == 0:
+                del self._maps[attr][value]
+
+    def lookup(self, attributes: dict) -> Optional[List[str]]:
+        """ Return the ids matching the first indexed attribute of
+            an equality filter, or None if no attribute is indexed
+        """
+        for attr, value in attributes.items():
+            if attr not in self._maps:
+                continue
+            try:
+                return list(self._maps[attr].get(value, ()))
+            except TypeError:
+                continue
+        return None
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+""" Journal module
+"""
+from os import path
+import json
+import os
+import threading
+
+
+class Journal():
+    """ Append-only log of the mutations of one class, folded into
+        the class snapshot file by compact()
+    """
+
+    def __init__(self, file_path: str, snapshot_path: str):
+        """ Initialize a Journal instance
+        """
+        self.file_path = file_path
+        self.snapshot_path = snapshot_path
+        self.rotated_path = file_path + ".old"
+        self._lock = threading.Lock()
+        self._file = None
+        self._compacting = False
+
+    def append(self, records: list) -> int:
+        """ Append records and return the journal size in bytes
+        """
+        lines = "".join(json.dumps(r) + "\n" for r in records)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.file_path, 'a')
+            self._file.write(lines)
+            self._file.flush()
+            return self._file.tell()
+
+    @staticmethod
+    def apply(objs_json: dict, file_path: str):
+        """ Apply the records of a journal file to a dict of
+            serialized objects; a truncated last line is ignored
+        """
+        if not path.exists(file_path):
+            return
+        with open(file_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record['op'] == 'save':
+                    objs_json[record['id']] = record['obj']
+                else:
+                    objs_json.pop(record['id'], None)
+
+    def replay(self, objs_json: dict):
+        """ Apply the rotated and current journals, oldest first
+        """
+        self.apply(objs_json, self.rotated_path)
+        self.apply(objs_json, self.file_path)
+
+    def compact_async(self):
+        """ Start a background compaction unless one is running
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """ Rotate the journal and fold it into a new snapshot
+        """
+        try:
+            with self._lock:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                if not path.exists(self.rotated_path) and \
+                        path.exists(self.file_path):
+                    os.replace(self.file_path, self.rotated_path)
+            if not path.exists(self.rotated_path):
+                return
+            objs_json = {}
+            if path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'r') as f:
+                    objs_json = json.load(f)
+            self.apply(objs_json, self.rotated_path)
+            tmp_path = self.snapshot_path + ".compact"
+            with open(tmp_path, 'w') as f:
+                json.dump(objs_json, f)
+            os.replace(tmp_path, self.snapshot_path)
+            os.remove(self.rotated_path)
+        finally:
+            with self._lock:
+                self._compacting = False
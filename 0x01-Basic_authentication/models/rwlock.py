@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+""" Readers-writer lock module
+"""
+from contextlib import contextmanager
+import threading
+
+
+class RWLock():
+    """ Lock shared by any number of readers or held by one writer;
+        waiting writers go before new readers. Not reentrant.
+    """
+
+    def __init__(self):
+        """ Initialize a RWLock instance
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """ Hold the lock as a reader for the block
+        """
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """ Hold the lock as the only writer for the block
+        """
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
@@ -0,0 +1,721 @@
+#!/usr/bin/env python3
+""" Storage module
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable, List
+from os import getenv, path
+from models.index import Index
+from models.journal import Journal
+from models.rwlock import RWLock
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+JOURNAL_MODE = getenv("MODELS_JOURNAL", "0") == "1"
+JOURNAL_COMPACT_BYTES = int(getenv("MODELS_JOURNAL_COMPACT_BYTES",
+                                   str(16 * 1024 * 1024)))
+FLUSH_INTERVAL = float(getenv("MODELS_FLUSH_INTERVAL", "0"))
+LAZY_LOAD = getenv("MODELS_LAZY_LOAD", "0") == "1"
+JSON_CACHE_SIZE = int(getenv("MODELS_JSON_CACHE_SIZE", "4096"))
+
+_storage_lock = threading.Lock()
+_revisions = itertools.count(time.time_ns() // 1000)
+
+
+def next_revision() -> int:
+    """ Return a new revision number, increasing across restarts
+    """
+    return next(_revisions)
+
+
+class LRUCache():
+    """ Bounded, thread-safe least-recently-used cache
+    """
+
+    def __init__(self, size: int):
+        """ Initialize a LRUCache instance
+        """
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value of a key, or None
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """ Store a value, evicting the least recently used ones
+        """
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Drop every entry
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class Storage(ABC):
+    """ Interface of the storage backends of Base objects
+    """
+
+    def __init__(self):
+        """ Initialize the load and persist timings, by class name,
+            and the cache of public JSON forms, sized by
+            MODELS_JSON_CACHE_SIZE
+        """
+        self.load_stats = {}
+        self.persist_stats = {}
+        self.json_cache = LRUCache(JSON_CACHE_SIZE)
+
+    @abstractmethod
+    def load(self, cls, lazy: bool = None):
+        """ Prepare the storage of a class at startup
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, obj):
+        """ Insert or update an object
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, obj):
+        """ Delete an object
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, cls, id: str):
+        """ Return one object by ID, or None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, cls, attributes: dict) -> List:
+        """ Return the objects whose attributes equal the given ones
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self, cls) -> int:
+        """ Return the number of objects
+        """
+        raise NotImplementedError
+
+    def all(self, cls) -> Iterable:
+        """ Return all objects
+        """
+        return self.search(cls, {})
+
+    def objects(self, cls) -> dict:
+        """ Return the objects by id
+        """
+        return {obj.id: obj for obj in self.all(cls)}
+
+    @abstractmethod
+    def version(self, cls) -> int:
+        """ Return the version of the class collection, which changes
+            every time it is loaded or one of its objects is
+            saved or removed
+        """
+        raise NotImplementedError
+
+    def page(self, cls, order: str = 'id', after: tuple = None,
+             limit: int = None) -> List:
+        """ Return the objects sorted by sort_key(obj, order) whose
+            key is greater than after, at most limit of them
+        """
+        def key(obj):
+            return sort_key(obj, order)
+
+        objs = self.all(cls)
+        if after is not None:
+            objs = [obj for obj in objs if key(obj) > after]
+        if limit is None:
+            return sorted(objs, key=key)
+        return heapq.nsmallest(limit, objs, key=key)
+
+    def persist(self, cls):
+        """ Write every object of the class to durable storage
+        """
+
+    def flush(self):
+        """ Persist every pending mutation
+        """
+
+    @contextmanager
+    def batch(self):
+        """ Group the mutations of the block into one write
+        """
+        yield
+
+
+def sort_key(obj, order: str) -> tuple:
+    """ Return the key sorting objects by the order attribute,
+        then by id
+    """
+    if order == 'id':
+        return (obj.id,)
+    return (getattr(obj, order), obj.id)
+
+
+def matches(obj, attributes: dict) -> bool:
+    """ Return True if every attribute of obj equals the given value
+    """
+    for k, v in attributes.items():
+        if (getattr(obj, k) != v):
+            return False
+    return True
+
+
+class FileStorage(Storage):
+    """ Objects kept in memory and persisted to
+        <directory>/.db_<Class>.json, or appended to a journal
+        in journal mode
+    """
+
+    def __init__(self, directory: str = "."):
+        """ Initialize a FileStorage instance with its own objects,
+            indexes, locks and pending writes
+        """
+        super(FileStorage, self).__init__()
+        self.directory = directory
+        self.data = {}
+        self.versions = {}
+        self.raw = {}
+        self.indexes = {}
+        self.journals = {}
+        self.locks = {}
+        self.dirty = {}
+        self.pending = {}
+        self._persist_lock = threading.Lock()
+        self._registry_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+        self._flusher = None
+
+    def file_path(self, s_class: str, extension: str = "json") -> str:
+        """ Return the path of a file of the class
+        """
+        return path.join(self.directory,
+                         ".db_{}.{}".format(s_class, extension))
+
+    def version(self, cls) -> int:
+        """ Return the version of the class collection
+        """
+        return self.versions.get(cls.__name__, 0)
+
+    def lock(self, cls) -> RWLock:
+        """ Return the readers-writer lock guarding the objects
+            and indexes of the class
+        """
+        s_class = cls.__name__
+        if self.locks.get(s_class) is None:
+            with self._registry_lock:
+                if self.locks.get(s_class) is None:
+                    self.locks[s_class] = RWLock()
+        return self.locks[s_class]
+
+    def index(self, cls) -> Index:
+        """ Return the secondary indexes declared in __indexes__
+        """
+        s_class = cls.__name__
+        if self.indexes.get(s_class) is None:
+            with self._registry_lock:
+                if self.indexes.get(s_class) is None:
+                    self.indexes[s_class] = Index(cls.__indexes__)
+        return self.indexes[s_class]
+
+    def journal(self, cls) -> Journal:
+        """ Return the journal of the class
+        """
+        s_class = cls.__name__
+        if self.journals.get(s_class) is None:
+            with self._registry_lock:
+                if self.journals.get(s_class) is None:
+                    self.journals[s_class] = Journal(
+                        self.file_path(s_class, "journal"),
+                        self.file_path(s_class))
+        return self.journals[s_class]
+
+    def load(self, cls, lazy: bool = None):
+        """ Load all objects from file, then replay the journal
+
+            With lazy (MODELS_LAZY_LOAD=1) only the JSON is parsed;
+            objects are built on first access. Timings are kept in
+            load_stats.
+        """
+        if lazy is None:
+            lazy = LAZY_LOAD
+        s_class = cls.__name__
+        file_path = self.file_path(s_class)
+        start = time.perf_counter()
+        objs_json = {}
+        if path.exists(file_path):
+            with open(file_path, 'r') as f:
+                objs_json = json.load(f)
+        if JOURNAL_MODE:
+            self.journal(cls).replay(objs_json)
+        with self.lock(cls).write():
+            self.data[s_class] = {}
+            self.versions[s_class] = next_revision()
+            self.raw.pop(s_class, None)
+            self.index(cls).clear()
+            self.load_stats[s_class] = {
+                'objects': len(objs_json),
+                'parse_seconds': time.perf_counter() - start,
+                'build_seconds': None}
+            if lazy:
+                self.raw[s_class] = objs_json
+            else:
+                self.build(cls, objs_json)
+
+    def build(self, cls, objs_json: dict):
+        """ Build and index the objects of a parsed file;
+            the caller holds the write lock
+        """
+        s_class = cls.__name__
+        start = time.perf_counter()
+        objs = self.data[s_class]
+        index = self.index(cls)
+        revision = self.versions[s_class]
+        for obj_id, obj_json in objs_json.items():
+            obj = cls(**obj_json)
+            obj._revision = revision
+            objs[obj_id] = obj
+            index.add(obj)
+        if s_class in self.load_stats:
+            self.load_stats[s_class]['build_seconds'] = \
+                time.perf_counter() - start
+
+    def objects(self, cls) -> dict:
+        """ Return the objects of the class by id, building them
+            first if the last load was lazy; hold the class lock
+            while using the returned dict
+        """
+        s_class = cls.__name__
+        if s_class in self.raw:
+            with self.lock(cls).write():
+                objs_json = self.raw.pop(s_class, None)
+                if objs_json is not None:
+                    self.build(cls, objs_json)
+        return self.data.setdefault(s_class, {})
+
+    def persist(self, cls):
+        """ Save all objects to file, from a snapshot taken
+            under the read lock
+        """
+        s_class = cls.__name__
+        file_path = self.file_path(s_class)
+        objs = self.objects(cls)
+        with self._file_lock:
+            start = time.perf_counter()
+            with self.lock(cls).read():
+                snapshot = list(objs.items())
+            objs_json = {}
+            for obj_id, obj in snapshot:
+                objs_json[obj_id] = obj.to_json(True)
+
+            with open(file_path + ".tmp", 'w') as f:
+                json.dump(objs_json, f)
+            os.replace(file_path + ".tmp", file_path)
+            count, seconds = self.persist_stats.get(s_class, (0, 0.0))
+            self.persist_stats[s_class] = (
+                count + 1, seconds + time.perf_counter() - start)
+
+    def write_journal(self, cls, records: list):
+        """ Append mutation records to the journal and compact it
+            in the background once it passes the size threshold
+        """
+        journal = self.journal(cls)
+        if journal.append(records) > JOURNAL_COMPACT_BYTES:
+            journal.compact_async()
+
+    def mark_dirty(self, cls, record: dict):
+        """ Record a mutation and persist it now, at the end of the
+            batch of the calling thread, or at the next flush when
+            MODELS_FLUSH_INTERVAL is set
+        """
+        s_class = cls.__name__
+        with self._persist_lock:
+            self.dirty[s_class] = cls
+            if JOURNAL_MODE:
+                self.pending.setdefault(s_class, {})[record['id']] = record
+            deferred = getattr(self._local, 'depth', 0) > 0 or \
+                FLUSH_INTERVAL > 0
+            if FLUSH_INTERVAL > 0 and self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, daemon=True)
+                self._flusher.start()
+        if not deferred:
+            self.flush()
+
+    def flush(self):
+        """ Persist every pending mutation
+        """
+        with self._flush_lock:
+            with self._persist_lock:
+                dirty = list(self.dirty.values())
+                pending = dict(self.pending)
+                self.dirty.clear()
+                self.pending.clear()
+            for klass in dirty:
+                if JOURNAL_MODE:
+                    records = pending.get(klass.__name__, {})
+                    if records:
+                        self.write_journal(klass, list(records.values()))
+                else:
+                    self.persist(klass)
+
+    def _flush_loop(self):
+        """ Background flusher: persists pending mutations every
+            MODELS_FLUSH_INTERVAL seconds, so a crash loses at most
+            that window of writes
+        """
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    @contextmanager
+    def batch(self):
+        """ Defer the persistence of the mutations of the calling
+            thread until its outermost batch block exits
+        """
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self.flush()
+
+    def save(self, obj):
+        """ Save an object
+        """
+        cls = obj.__class__
+        objs = self.objects(cls)
+        with self.lock(cls).write():
+            obj._revision = next_revision()
+            self.versions[cls.__name__] = obj._revision
+            objs[obj.id] = obj
+            self.index(cls).add(obj)
+        record = {'op': 'save', 'id': obj.id}
+        if JOURNAL_MODE:
+            record['obj'] = obj.to_json(True)
+        self.mark_dirty(cls, record)
+
+    def remove(self, obj):
+        """ Remove an object
+        """
+        cls = obj.__class__
+        objs = self.objects(cls)
+        with self.lock(cls).write():
+            if objs.get(obj.id) is None:
+                return
+            del objs[obj.id]
+            self.versions[cls.__name__] = next_revision()
+            self.index(cls).discard(obj.id)
+        self.mark_dirty(cls, {'op': 'remove', 'id': obj.id})
+
+    def count(self, cls) -> int:
+        """ Count all objects
+        """
+        objs = self.objects(cls)
+        with self.lock(cls).read():
+            return len(objs)
+
+    def get(self, cls, id: str):
+        """ Return one object by ID
+        """
+        objs = self.objects(cls)
+        with self.lock(cls).read():
+            return objs.get(id)
+
+    def search(self, cls, attributes: dict) -> List:
+        """ Search all objects with matching attributes,
+            using a secondary index for equality on an indexed one
+        """
+        objs = self.objects(cls)
+        with self.lock(cls).read():
+            ids = self.index(cls).lookup(attributes)
+            if ids is not None:
+                candidates = [objs[i] for i in ids if i in objs]
+            else:
+                candidates = list(objs.values())
+        return [obj for obj in candidates if matches(obj, attributes)]
+
+
+class SQLiteStorage(Storage):
+    """ Objects stored one row each in an SQLite table per class,
+        with a column and an index for every attribute of
+        __indexes__ and the whole object as JSON; the version of
+        each table is a row of _versions
+    """
+
+    SQL_TYPES = (str, int, float, type(None))
+
+    def __init__(self, file_path: str):
+        """ Initialize a SQLiteStorage instance
+        """
+        super(SQLiteStorage, self).__init__()
+        self.file_path = file_path
+        self._local = threading.local()
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, isolation_level=None,
+                                   timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    def table(self, cls) -> str:
+        """ Create the table and indexes of a class if needed
+            and return the table name
+        """
+        name = cls.__name__
+        if name in self._tables:
+            return name
+        with self._tables_lock:
+            if name not in self._tables:
+                conn = self.connection()
+                columns = "".join(', "{}"'.format(attr)
+                                  for attr in cls.__indexes__)
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS "{}" (id TEXT PRIMARY KEY, '
+                    'revision INTEGER, data TEXT{})'.format(name, columns))
+                for attr in cls.__indexes__:
+                    conn.execute(
+                        'CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                        'ON "{0}" ("{1}")'.format(name, attr))
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS "{0}_created_at" ON "{0}" '
+                    '({1}, id)'.format(name, self.column(cls, 'created_at')))
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS _versions '
+                    '(name TEXT PRIMARY KEY, version INTEGER)')
+                conn.execute('INSERT OR IGNORE INTO _versions VALUES (?, ?)',
+                             (name, next_revision()))
+                for event in ('INSERT', 'UPDATE', 'DELETE'):
+                    conn.execute(
+                        'CREATE TRIGGER IF NOT EXISTS "{0}_{1}_version" '
+                        'AFTER {1} ON "{0}" BEGIN UPDATE _versions '
+                        "SET version = version + 1 WHERE name = '{0}'; "
+                        'END'.format(name, event))
+                self._tables.add(name)
+        return name
+
+    @staticmethod
+    def column(cls, attr: str) -> str:
+        """ Return the SQL expression of an attribute: its column
+            if it has one, its JSON field otherwise
+        """
+        if not attr.isidentifier():
+            raise ValueError("Invalid attribute: {}".format(attr))
+        if attr == 'id' or attr in cls.__indexes__:
+            return '"{}"'.format(attr)
+        return "json_extract(data, '$.{}')".format(attr)
+
+    @staticmethod
+    def sql_value(value):
+        """ Return a value as stored in the table
+        """
+        if type(value) is datetime:
+            return value.strftime(TIMESTAMP_FORMAT)
+        return value
+
+    def hydrate(self, cls, data: str, revision: int):
+        """ Build an object from its stored row
+        """
+        obj = cls(**json.loads(data))
+        obj._revision = revision
+        return obj
+
+    def load(self, cls, lazy: bool = None):
+        """ Create the table of the class and record its size
+        """
+        start = time.perf_counter()
+        self.table(cls)
+        self.load_stats[cls.__name__] = {
+            'objects': self.count(cls),
+            'parse_seconds': time.perf_counter() - start,
+            'build_seconds': 0.0}
+
+    def save(self, obj):
+        """ Insert or update the row of an object
+        """
+        cls = obj.__class__
+        name = self.table(cls)
+        obj._revision = next_revision()
+        attrs = cls.__indexes__
+        columns = "".join(', "{}"'.format(attr) for attr in attrs)
+        updates = "".join(', "{0}" = excluded."{0}"'.format(attr)
+                          for attr in attrs)
+        values = [obj.id, obj._revision, json.dumps(obj.to_json(True))]
+        values.extend(getattr(obj, attr, None) for attr in attrs)
+        self.connection().execute(
+            'INSERT INTO "{0}" (id, revision, data{1}) VALUES (?, ?, ?{2}) '
+            'ON CONFLICT(id) DO UPDATE SET revision = excluded.revision, '
+            'data = excluded.data{3}'.format(
+                name, columns, ", ?" * len(attrs), updates), values)
+
+    def remove(self, obj):
+        """ Delete the row of an object
+        """
+        cls = obj.__class__
+        name = self.table(cls)
+        self.connection().execute(
+            'DELETE FROM "{}" WHERE id = ?'.format(name), (obj.id,))
+
+    def version(self, cls) -> int:
+        """ Return the version of the table, kept in the database by
+            triggers so that it changes for every process sharing it
+        """
+        name = self.table(cls)
+        return self.connection().execute(
+            'SELECT version FROM _versions WHERE name = ?',
+            (name,)).fetchone()[0]
+
+    def get(self, cls, id: str):
+        """ Return one object by ID
+        """
+        name = self.table(cls)
+        row = self.connection().execute(
+            'SELECT data, revision FROM "{}" WHERE id = ?'.format(name),
+            (id,)).fetchone()
+        if row is None:
+            return None
+        return self.hydrate(cls, *row)
+
+    def search(self, cls, attributes: dict) -> List:
+        """ Search all objects with matching attributes; equality on
+            stored fields is done in SQL, other attributes such as
+            properties are only checked on the loaded objects
+        """
+        name = self.table(cls)
+        stored = cls.slot_names()
+        clauses = []
+        values = []
+        for attr, value in attributes.items():
+            if attr not in stored:
+                continue
+            value = self.sql_value(value)
+            if type(value) not in self.SQL_TYPES or type(value) is bool:
+                continue
+            if attr == 'id' or attr in cls.__indexes__:
+                clauses.append('"{}" IS ?'.format(attr))
+            else:
+                clauses.append("json_extract(data, ?) IS ?")
+                values.append('$."{}"'.format(attr))
+            values.append(value)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self.connection().execute(
+            'SELECT data, revision FROM "{}"{} ORDER BY rowid'.format(
+                name, where), values)
+        objs = [self.hydrate(cls, *row) for row in rows]
+        return [obj for obj in objs if matches(obj, attributes)]
+
+    def page(self, cls, order: str = 'id', after: tuple = None,
+             limit: int = None) -> List:
+        """ Return the objects sorted by order then id after the key
+            after, selected and sorted in SQL; the leading >= lets
+            SQLite seek the index to the cursor
+        """
+        name = self.table(cls)
+        first = self.column(cls, order)
+        columns = first if order == 'id' else first + ", id"
+        sql = 'SELECT data, revision FROM "{}"'.format(name)
+        values = []
+        if after is not None:
+            after = [self.sql_value(value) for value in after]
+            sql += " WHERE {} >= ? AND ({}) > ({})".format(
+                first, columns, ", ".join("?" * len(after)))
+            values = [after[0]] + after
+        sql += " ORDER BY {}".format(columns)
+        if limit is not None:
+            sql += " LIMIT ?"
+            values.append(limit)
+        rows = self.connection().execute(sql, values)
+        return [self.hydrate(cls, *row) for row in rows]
+
+    def count(self, cls) -> int:
+        """ Count all rows
+        """
+        name = self.table(cls)
+        return self.connection().execute(
+            'SELECT COUNT(*) FROM "{}"'.format(name)).fetchone()[0]
+
+    @contextmanager
+    def batch(self):
+        """ Run the mutations of the block in one transaction
+            of the current thread
+        """
+        conn = self.connection()
+        if self._local.depth == 0:
+            conn.execute("BEGIN")
+        self._local.depth += 1
+        try:
+            yield
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.execute("COMMIT")
+
+
+_storage = None
+
+
+def get_storage() -> Storage:
+    """ Return the storage selected by MODELS_STORAGE:
+        "file" (default) or "sqlite", at MODELS_SQLITE_PATH
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if getenv("MODELS_STORAGE", "file") == "sqlite":
+                    _storage = SQLiteStorage(
+                        getenv("MODELS_SQLITE_PATH", ".db.sqlite3"))
+                else:
+                    _storage = FileStorage()
+    return _storage
+
+
+def set_storage(storage: Storage):
+    """ Replace the storage used by every class
+    """
+    global _storage
+    _storage = storage
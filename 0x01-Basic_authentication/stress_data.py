@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+""" Multi-threaded stress test of the models DATA store
+
+Usage:
+    ./stress_data.py [--threads 32] [--seconds 5] [--users 500]
+
+Threads mix save, remove, get, search, count, all and save_to_file
+on User; the store, its email index and the saved file are then
+checked for consistency. Exits with status 1 on any failure.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from models.user import User
+
+
+def worker(seed: int, deadline: float, size: int, errors: list):
+    """ Run random operations until the deadline
+    """
+    rng = random.Random(seed)
+    try:
+        while time.monotonic() < deadline:
+            op = rng.random()
+            email = "user{}@example.com".format(rng.randrange(size))
+            if op < 0.25:
+                user = User(email=email)
+                user.first_name = str(seed)
+                user.save()
+            elif op < 0.35:
+                users = User.search({'email': email})
+                if users:
+                    users[0].remove()
+            elif op < 0.65:
+                for user in User.search({'email': email}):
+                    if user.email != email:
+                        errors.append("search returned {} for {}".format(
+                            user.email, email))
+            elif op < 0.80:
+                users = User.all()
+                if users and User.get(users[0].id) is None:
+                    if users[0].id in User.objects():
+                        errors.append("get missed {}".format(users[0].id))
+            elif op < 0.95:
+                User.count()
+            else:
+                User.save_to_file()
+    except Exception as e:
+        errors.append(repr(e))
+
+
+def check() -> list:
+    """ Check that the index and the saved file match DATA
+    """
+    errors = []
+    objs = dict(User.objects())
+    for obj_id, user in objs.items():
+        if user not in User.search({'email': user.email}):
+            errors.append("{} missing from the email index".format(obj_id))
+    User.save_to_file()
+    User.load_from_file()
+    if set(User.objects().keys()) != set(objs.keys()):
+        errors.append("file does not match DATA")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DATA stress test")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    User.load_from_file()
+    errors = []
+    deadline = time.monotonic() + args.seconds
+    threads = [threading.Thread(target=worker,
+                                args=(i, deadline, args.users, errors))
+               for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    errors.extend(check())
+
+    for error in errors[:20]:
+        print(error)
+    print("{} threads, {} users: {}".format(
+        args.threads, User.count(), "FAILED" if errors else "OK"))
+    sys.exit(1 if errors else 0)
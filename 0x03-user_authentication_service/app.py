@@ -9,6 +9,14 @@ app = Flask(__name__)
 AUTH = Auth()
 
 
+@app.teardown_appcontext
+def remove_session(exception) -> None:
+    """
+    Release the database session of the request thread
+    """
+    AUTH._db.remove_session()
+
+
 @app.route("/")
 def welcome():
     """
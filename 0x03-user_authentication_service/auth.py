@@ -6,16 +6,48 @@ import bcrypt
 from db import DB
 from user import User
 from sqlalchemy.exc import NoResultFound
+import os
+import time
 import uuid
 from typing import Union
 
+CALIBRATION_ROUNDS = 8
+MAX_ROUNDS = 31
+
+_bcrypt_rounds = int(os.environ.get("AUTH_BCRYPT_ROUNDS", "12"))
+
+
+def _calibrate_bcrypt_rounds(target_ms: float, minimum: int = 10) -> int:
+    """
+    Benchmark bcrypt on this host and return the highest cost
+    whose hash time fits in target_ms, but never less than minimum.
+    """
+    salt = bcrypt.gensalt(rounds=CALIBRATION_ROUNDS)
+    elapsed = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    rounds = CALIBRATION_ROUNDS
+    while (rounds < MAX_ROUNDS and
+           elapsed * 2 ** (rounds + 1 - CALIBRATION_ROUNDS) * 1000
+           <= target_ms):
+        rounds += 1
+    return max(minimum, min(rounds, MAX_ROUNDS))
+
+
+def _hash_rounds(hashed_password: bytes) -> int:
+    """Return the cost a bcrypt hash was created with."""
+    return int(hashed_password.split(b"$")[2])
+
 
 def _hash_password(password: str) -> bytes:
     """
     Hashes a password using bcrypt and
     Return the hashed password as bytes.
     """
-    hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    salt = bcrypt.gensalt(rounds=_bcrypt_rounds)
+    hashed_password = bcrypt.hashpw(password.encode(), salt)
     return hashed_password
 
 
@@ -29,7 +61,15 @@ class Auth:
     """
 
     def __init__(self):
+        """
+        Initialize the database and, when AUTH_BCRYPT_TARGET_MS is set,
+        pick the bcrypt cost that fits that login latency on this host.
+        """
+        global _bcrypt_rounds
         self._db = DB()
+        target_ms = os.environ.get("AUTH_BCRYPT_TARGET_MS")
+        if target_ms:
+            _bcrypt_rounds = _calibrate_bcrypt_rounds(float(target_ms))
 
     def register_user(self, email: str, password: str) -> User:
         """
@@ -54,7 +94,12 @@ class Auth:
 
         user_password = user.hashed_password
         passwd = password.encode("utf-8")
-        return bcrypt.checkpw(passwd, user_password)
+        if not bcrypt.checkpw(passwd, user_password):
+            return False
+        if _hash_rounds(user_password) != _bcrypt_rounds:
+            self._db.update_user(user.id,
+                                 hashed_password=_hash_password(password))
+        return True
 
     def create_session(self, email):
         """Create a new session for the user and return the session ID"""
@@ -74,16 +119,14 @@ class Auth:
         if session_id is None:
             return None
 
-        user_id = self._db.get_user_from_session_id(session_id)
-
-        if user_id is None:
+        try:
+            return self._db.find_user_by(session_id=session_id)
+        except NoResultFound:
             return None
 
-        return self._db.find_user_by_id(user_id)
-
     def destroy_session(self, user_id: int) -> None:
         """Destroy session"""
-        self._db.update_user_session_id(user_id, None)
+        self._db.update_user(user_id, session_id=None)
 
     def get_reset_password_token(self, email: str) -> str:
         """Generates a password reset token for a user.
@@ -102,6 +145,8 @@ class Auth:
     def update_password(self, reset_token: str, password: str) -> None:
         """Updates a user's password given the user's reset token.
         """
+        if reset_token is None:
+            raise ValueError()
         user = None
         try:
             user = self._db.find_user_by(reset_token=reset_token)
@@ -2,7 +2,7 @@
 """DB module
 """
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.session import Session
 from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.orm.exc import NoResultFound
@@ -21,16 +21,18 @@ class DB:
         self._engine = create_engine("sqlite:///a.db", echo=True)
         Base.metadata.drop_all(self._engine)
         Base.metadata.create_all(self._engine)
-        self.__session = None
+        self.__session = scoped_session(sessionmaker(bind=self._engine))
 
     @property
     def _session(self):
-        """Memoized session object
+        """Memoized session object of the current thread
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        return self.__session()
+
+    def remove_session(self) -> None:
+        """Close the session of the current thread
+        """
+        self.__session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """
@@ -44,18 +46,14 @@ class DB:
 
     def find_user_by(self, **kwargs) -> User:
         """
-        Find a user in the database based on the provided keyword args
-        and return The first User object that matches the
-        filtering conditions or raise error
+        Find the user matching all the provided keyword args
+        in one query, raise NoResultFound if there is none and
+        InvalidRequestError if an attribute does not exist
         """
-        users = self._session.query(User)
-        for i, j in kwargs.items():
-            if i not in User.__dict__:
+        for key in kwargs:
+            if key not in User.__table__.columns:
                 raise InvalidRequestError
-            for usr in users:
-                if getattr(usr, i) == j:
-                    return usr
-        raise NoResultFound
+        return self._session.query(User).filter_by(**kwargs).one()
 
     def update_user(self, user_id: int, **kwargs) -> None:
         """
@@ -1,100 +1,262 @@
 #!/usr/bin/env python3
 """
-Main file
+Load generator for the user authentication service
+
+Usage:
+    ./main.py [--url http://localhost:5000] [--concurrency 8]
+              [--users 100] [--iterations 10]
+              [--mix profile=6,login=2,wrong_password=1,reset=1]
+              [--output loadtest.json]
+
+Without --url the requests go through the Flask test client of app.py,
+in process. Each simulated user registers and logs in, runs
+--iterations scenarios picked at random with the weights of --mix,
+then logs out. Throughput and p50/p95/p99 latency are printed for each
+endpoint and written as JSON to --output so runs can be compared.
+The bcrypt cost can be set for the run with AUTH_BCRYPT_ROUNDS.
 """
-import requests
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from typing import Dict, List, Optional, Tuple
 
-EMAIL = "guillaume@holberton.io"
 PASSWD = "b4l0u"
 NEW_PASSWD = "t4rt1fl3tt3"
+DEFAULT_MIX = "profile=6,login=2,wrong_password=1,reset=1"
+
+
+class Client:
+    """Sends requests to the service and records their latency
+    """
+
+    def __init__(self, url: Optional[str], recorder: "Recorder"):
+        """Use a requests session on url, or the Flask test client
+        """
+        self.recorder = recorder
+        if url:
+            import requests
+            self.url = url.rstrip("/")
+            self.session = requests.Session()
+        else:
+            from app import app
+            self.url = ""
+            self.session = app.test_client()
+
+    def call(self, method: str, path: str, expected: int,
+             data: Dict = None,
+             session_id: str = None) -> Tuple[int, Optional[Dict], str]:
+        """Send one request and return its status, JSON body
+        and session_id cookie
+        """
+        headers = {}
+        if session_id:
+            headers["Cookie"] = "session_id={}".format(session_id)
+        start = time.perf_counter()
+        if self.url:
+            response = self.session.request(method, self.url + path,
+                                            data=data, headers=headers,
+                                            allow_redirects=False)
+        else:
+            response = self.session.open(path, method=method, data=data,
+                                         headers=headers)
+        elapsed = time.perf_counter() - start
+        status = response.status_code
+        self.recorder.observe("{} {}".format(method, path), elapsed,
+                              status == expected)
+        body = None
+        if response.headers.get("Content-Type", "").startswith(
+                "application/json"):
+            body = response.json() if self.url else response.get_json()
+        cookie = SimpleCookie(response.headers.get("Set-Cookie", ""))
+        new_session = cookie["session_id"].value \
+            if "session_id" in cookie else None
+        return status, body, new_session
+
+
+class Recorder:
+    """Thread-safe latency samples by endpoint
+    """
+
+    def __init__(self):
+        """Initialize an empty recorder
+        """
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, seconds: float, ok: bool) -> None:
+        """Record one request
+        """
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
 
 
-def register_user(email: str, password: str) -> None:
-    """Tests registering a user
+def percentile(values: List[float], q: float) -> float:
+    """Return the nearest-rank percentile of sorted values
     """
-    url = 'http://localhost:5000/users'
-    data = {'email': email, 'password': password}
-    response = requests.post(url, data=data)
-    assert response.status_code == 201
+    if not values:
+        return 0.0
+    rank = max(math.ceil(q / 100.0 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
 
 
-def log_in_wrong_password(email: str, password: str) -> None:
-    """Tests logging in with a wrong password
+def scenario_login(client: Client, email: str, state: Dict) -> None:
+    """Log in again, replacing the session
     """
-    url = 'http://localhost:5000/sessions'
-    data = {'email': email, 'password': password}
-    response = requests.post(url, data=data)
-    assert response.status_code == 401
+    _, _, session_id = client.call("POST", "/sessions", 200,
+                                   {"email": email,
+                                    "password": state["password"]})
+    state["session_id"] = session_id or state["session_id"]
 
 
-def log_in(email: str, password: str) -> str:
-    """Tests logging in
+def scenario_wrong_password(client: Client, email: str, state: Dict) -> None:
+    """Log in with a wrong password
     """
-    url = 'http://localhost:5000/sessions'
-    data = {'email': email, 'password': password}
-    response = requests.post(url, data=data)
-    assert response.status_code == 200
-    session_id = response.cookies.get('session_id')
-    return session_id
+    client.call("POST", "/sessions", 401,
+                {"email": email, "password": "not-" + state["password"]})
 
 
-def profile_unlogged() -> None:
-    """Tests retrieving profile information while logged out
+def scenario_profile(client: Client, email: str, state: Dict) -> None:
+    """Fetch the profile with the current session
     """
-    url = 'http://localhost:5000/profile'
-    response = requests.get(url)
-    assert response.status_code == 403
+    client.call("GET", "/profile", 200, session_id=state["session_id"])
 
 
-def profile_logged(session_id: str) -> None:
-    """Tests retrieving profile information while logged in
+def scenario_reset(client: Client, email: str, state: Dict) -> None:
+    """Reset the password with a reset token
     """
-    url = 'http://localhost:5000/profile'
-    cookies = {'session_id': session_id}
-    response = requests.get(url, cookies=cookies)
-    assert response.status_code == 200
-    data = response.json()
-    assert data['email'] == 'guillaume@holberton.io'
+    _, body, _ = client.call("POST", "/reset_password", 200,
+                             {"email": email})
+    if not body:
+        return
+    password = NEW_PASSWD if state["password"] == PASSWD else PASSWD
+    status, _, _ = client.call("PUT", "/reset_password", 200,
+                               {"email": email,
+                                "reset_token": body["reset_token"],
+                                "new_password": password})
+    if status == 200:
+        state["password"] = password
+
+
+SCENARIOS = {
+    "login": scenario_login,
+    "wrong_password": scenario_wrong_password,
+    "profile": scenario_profile,
+    "reset": scenario_reset,
+}
 
 
-def log_out(session_id: str) -> None:
-    """Tests logging out of a session
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse name=weight pairs separated by commas
     """
-    url = 'http://localhost:5000/sessions'
-    cookies = {'session_id': session_id}
-    response = requests.delete(url, cookies=cookies)
-    assert response.status_code == 200
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError("unknown scenario: {}".format(name))
+        weights[name] = float(weight or 1)
+    return weights
 
 
-def reset_password_token(email: str) -> str:
-    """Tests requesting a password reset
+def run_user(url: Optional[str], recorder: Recorder, email: str,
+             iterations: int, weights: Dict[str, float],
+             seed: int) -> None:
+    """Run the whole life of one simulated user
     """
-    url = 'http://localhost:5000/reset_password'
-    data = {'email': email}
-    response = requests.post(url, data=data)
-    assert response.status_code == 200
-    data = response.json()
-    return data['reset_token']
+    rng = random.Random(seed)
+    client = Client(url, recorder)
+    client.call("POST", "/users", 200, {"email": email, "password": PASSWD})
+    state = {"password": PASSWD, "session_id": None}
+    scenario_login(client, email, state)
+    names = list(weights)
+    for name in rng.choices(names, [weights[n] for n in names],
+                            k=iterations):
+        SCENARIOS[name](client, email, state)
+    client.call("DELETE", "/sessions", 302, session_id=state["session_id"])
 
 
-def update_password(email: str, reset_token: str, new_password: str) -> None:
-    """Tests updating a user's password
+def report(recorder: Recorder, wall: float, args) -> Dict:
+    """Return the results of a run
     """
-    url = 'http://localhost:5000/reset_password'
-    data = {'email': email,
-            'reset_token': reset_token,
-            'new_password': new_password}
-    response = requests.put(url, data=data)
-    assert response.status_code == 200
+    endpoints = {}
+    total = 0
+    for endpoint, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        total += len(samples)
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": recorder.errors.get(endpoint, 0),
+            "throughput": len(samples) / wall,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": samples[-1] * 1000,
+        }
+    return {
+        "target": args.url or "test_client",
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "iterations": args.iterations,
+        "mix": args.mix,
+        "seconds": wall,
+        "requests": total,
+        "errors": sum(recorder.errors.values()),
+        "throughput": total / wall,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(results: Dict) -> None:
+    """Print the results as a table
+    """
+    print("{:<24}{:>9}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+        "endpoint", "requests", "errors", "req/s", "p50 ms",
+        "p95 ms", "p99 ms"))
+    for endpoint, row in results["endpoints"].items():
+        print("{:<24}{:>9}{:>8}{:>10.1f}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+            endpoint, row["requests"], row["errors"], row["throughput"],
+            row["p50_ms"], row["p95_ms"], row["p99_ms"]))
+    print("{} requests in {:.2f}s: {:.1f} req/s, {} errors".format(
+        results["requests"], results["seconds"], results["throughput"],
+        results["errors"]))
 
 
 if __name__ == "__main__":
-    register_user(EMAIL, PASSWD)
-    log_in_wrong_password(EMAIL, NEW_PASSWD)
-    profile_unlogged()
-    session_id = log_in(EMAIL, PASSWD)
-    profile_logged(session_id)
-    log_out(session_id)
-    reset_token = reset_password_token(EMAIL)
-    update_password(EMAIL, reset_token, NEW_PASSWD)
-    log_in(EMAIL, NEW_PASSWD)
+    parser = argparse.ArgumentParser(description="Auth service load test")
+    parser.add_argument("--url", default=None,
+                        help="base URL; the Flask test client if omitted")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadtest.json")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    if args.url is None:
+        import app
+        app.AUTH._db._engine.echo = False
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_user, args.url, recorder,
+                                   "user{}-{}@example.com".format(run_id, i),
+                                   args.iterations, weights, args.seed + i)
+                   for i in range(args.users)]
+        for future in futures:
+            future.result()
+    results = report(recorder, time.perf_counter() - start, args)
+    print_report(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)